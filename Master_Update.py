@@ -3,12 +3,16 @@
 # Excelマスター自動更新スクリプト
 ###########
 
+import os
+import shutil
+import tempfile
+
 import openpyxl
 from openpyxl import load_workbook
 
 def update_excel_master(excel_path: str):
-    # 1. ワークブックをロード（読み書き両用）
-    wb = load_workbook(excel_path)
+    # 1. ワークブックをロード（読み書き両用。.xlsm のマクロも保存時に残す）
+    wb = load_workbook(excel_path, keep_vba=True)
 
     # 2. テーブル領域を読んで辞書を作成
     #    openpyxl はテーブルオブジェクトを通じても範囲取得可能
@@ -53,11 +57,18 @@ def update_excel_master(excel_path: str):
         ws.cell(row=1, column=new_col, value=col_name)
         return new_col
 
+    # 書き込み対象の列だけを走査してセルを更新する
+    #    行全体の Cell オブジェクトを生成しないよう、値は values_only で一括取得しておく
+    def write_column(ws, col, values):
+        cells = ws.iter_rows(min_row=2, max_row=len(values) + 1, min_col=col, max_col=col)
+        for (cell,), value in zip(cells, values):
+            cell.value = value
+
     # m_Groups へ SubcategoryName 列を追加取得
     scname_col_in_groups = ensure_column(grp_ws, 'サブカテゴリ名')
-    for row in grp_ws.iter_rows(min_row=2):
-        scid = row[gpid_col-1].value
-        row[scname_col_in_groups-1].value = subcat_map.get(scid, '未定義ID')
+    grp_scids = [row[gpid_col-1] for row in grp_ws.iter_rows(min_row=2, values_only=True)]
+    write_column(grp_ws, scname_col_in_groups,
+                 [subcat_map.get(scid, '未定義ID') for scid in grp_scids])
 
     # 4. m_Words シートを更新：GroupName + SubcategoryName
     headers = {cell.value: idx for idx, cell in enumerate(next(word_ws.iter_rows(min_row=1, max_row=1)), start=1)}
@@ -67,14 +78,36 @@ def update_excel_master(excel_path: str):
     wgroupname_col = ensure_column(word_ws, 'グループ名')
     wsubcatname_col = ensure_column(word_ws, 'サブカテゴリ名')
 
-    for row in word_ws.iter_rows(min_row=2):
-        gid = row[wgid_col-1].value
-        gname, scid = group_map.get(gid, ('未定義G', None))
-        row[wgroupname_col-1].value   = gname
-        row[wsubcatname_col-1].value  = subcat_map.get(scid,  '未定義SC')
+    # グループID → (グループ名, サブカテゴリ名) を先に結合しておき、各行は1回の辞書引きで済ませる
+    joined_map = {
+        gid: (gname, subcat_map.get(scid, '未定義SC'))
+        for gid, (gname, scid) in group_map.items()
+    }
+    undefined = ('未定義G', '未定義SC')
+
+    word_gnames, word_scnames = [], []
+    for row in word_ws.iter_rows(min_row=2, values_only=True):
+        gname, scname = joined_map.get(row[wgid_col-1], undefined)
+        word_gnames.append(gname)
+        word_scnames.append(scname)
+    write_column(word_ws, wgroupname_col, word_gnames)
+    write_column(word_ws, wsubcatname_col, word_scnames)
 
     # 5. 上書き保存
-    wb.save(excel_path)
+    #    同じフォルダの一時ファイルへ書き出してから置き換え、保存途中の失敗でマスターを壊さない
+    fd, tmp_path = tempfile.mkstemp(
+        suffix=os.path.splitext(excel_path)[1],
+        dir=os.path.dirname(os.path.abspath(excel_path)),
+    )
+    os.close(fd)
+    try:
+        wb.save(tmp_path)
+        # mkstemp の一時ファイルは所有者のみ読み書き可なので、元のファイルの権限を引き継ぐ
+        shutil.copymode(excel_path, tmp_path)
+        os.replace(tmp_path, excel_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
     print(f"Updated and saved: {excel_path}")
 
 
@@ -3,42 +3,79 @@
 #  NGワード処理ロジックスクリプト
 #######################
 
+import array
+import bisect
+import html
 import json
+import os
 import re
+import sys
 import logging
+import logging.handlers
 import functools
+import itertools
 import unicodedata
 from typing import (
     Any, 
+    Callable,
     Dict, 
+    Iterable,
     List, 
+    Match,
     Tuple, 
     Optional,
     Pattern,
-    Set,
+    Sequence,
     Union,
     TypedDict, 
 )
 
+# orjson があれば C 実装のパーサーで NGword.json を読み込む（なければ標準の json）
+# orjson.JSONDecodeError は json.JSONDecodeError のサブクラスなので、呼び出し側の例外処理は共通
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)  # DEBUGレベルでログ出力（開発時）
-# コンソール用
-console_handler = logging.StreamHandler()
-# ファイル用
-file_handler = logging.FileHandler("debug.log", encoding="utf-8")
 
-formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S")
-console_handler.setFormatter(formatter)
-file_handler.setFormatter(formatter)
+def _configure_logging() -> None:
+    """
+    モジュール用ロガーにコンソール出力（端末実行時のみ）と debug.log への出力を設定する。
+    再読み込み（Streamlit のホットリロードや pytest）でハンドラが重複しないよう、設定済みなら何もしない。
+    debug.log は最初の書き出し時に開き、DEBUG 行はメモリにためて WARNING 以上か容量到達時にまとめて書き出す。
+    """
+    if logger.handlers:
+        return
+    logger.setLevel(logging.DEBUG)  # DEBUGレベルでログ出力（開発時）
+    # ルートロガーへは流さない（アプリ側の設定と二重に出力しない）
+    logger.propagate = False
+
+    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+    # コンソール用
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    # ファイル用
+    file_handler = logging.FileHandler("debug.log", encoding="utf-8", delay=True)
+    file_handler.setFormatter(formatter)
+    buffered_file_handler = logging.handlers.MemoryHandler(
+        capacity=1024, flushLevel=logging.WARNING, target=file_handler
+    )
+
+    # 端末から実行しているときだけコンソールにも出す（バッチ実行では debug.log のみ）
+    if sys.stderr is not None and sys.stderr.isatty():
+        logger.addHandler(console_handler)
+    logger.addHandler(buffered_file_handler)
 
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+_configure_logging()
 
 # --- TypedDict 定義 ---
 class NGWordDetail(TypedDict):
     original: str
     pattern: Pattern[str]
+    literal: str
     category: str
     指摘事項: str
     改善提案: Union[str, List[str]]
@@ -93,18 +130,54 @@ def _basic_normalize_char(ch: str) -> str:
     if ch.isascii():
         ch = ch.lower()
     return ch
-# ───────────────────────────────────────────────────────────────────────
 
-# ロガーの初期設定（必要に応じて出力先やレベルを調整）
-logging.basicConfig(level=logging.INFO)
+class _CharTable(Dict[int, str]):
+    """
+    str.translate 用の変換テーブル。未登録の文字は初回に 1 文字単位の変換関数で求めて登録する。
+    NFC 未正規化の文字（結合濁点・互換漢字など）も、文字列全体を C レベルの translate 1 回で処理できる。
+    """
 
+    def __init__(self, convert: Callable[[str], str], seed: Iterable[int] = ()) -> None:
+        super().__init__()
+        self._convert = convert
+        for cp in seed:
+            self[cp] = convert(chr(cp))
+
+    def __missing__(self, cp: int) -> str:
+        converted = self[cp] = self._convert(chr(cp))
+        return converted
+
+# _basic_normalize_char（NFC → 全角→半角 → ASCII小文字化）を文字列全体に str.translate で一括適用するテーブル
+_NORMALIZE_TABLE: _CharTable = _CharTable(
+    _basic_normalize_char,
+    (*FW_DIGITS, *FW_UPPER, *FW_LOWER, *FW_PUNCT, *range(ord("A"), ord("Z") + 1)),
+)
+# カタカナ（ァ〜ン）→ひらがな
+_KATA_TO_HIRA: Dict[int, str] = {cp: chr(cp - 0x60) for cp in range(ord("ァ"), ord("ン") + 1)}
+# ひらがな(U+3041–U+3096)→対応するカタカナ(U+30A1–U+30F6)
+_HIRA_TO_KATA: Dict[int, int] = str.maketrans("ぁあぃいぅうぇえぉおかがきぎくぐけげこごさざしじすずせぜそぞ\
+ただちぢっつづてでとどなにぬねのはばぱひびぴふぶぷへべぺほぼぽ\
+まみむめもやゃゆゅよょらりるれろわゐゑをんゔゕゖ",
+                                              "ァアィイゥウェエォオカガキギクグケゲコゴサザシジスズセゼソゾ\
+タダチヂッツヅテデトドナニヌネノハバパヒビピフブプヘベペホボポ\
+マミムメモヤャユュヨョラリルレロワヰヱヲンヴヵヶ")
+# マッチング用：_basic_normalize_char に加えてカタカナ→ひらがな
+_MATCHING_TABLE: _CharTable = _CharTable(
+    lambda ch: _basic_normalize_char(ch).translate(_KATA_TO_HIRA),
+    (*_NORMALIZE_TABLE, *_KATA_TO_HIRA),
+)
+# 非空白に挟まれた ASCII スペースの連続（normalize_text でひとつにまとめる）
+_SPACE_RUN: Pattern[str] = re.compile(r'(?<=\S) +(?=\S)')
+# 空白の連続（re の \s は str.isspace() と同じ文字集合）
+_WHITESPACE_RUN: Pattern[str] = re.compile(r"\s+")
 # ───────────────────────────────────────────────────────────────────────
+
 # JSON読み込み
 def load_json(file_path: str) -> Dict[str, Any]:
     
     try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            return json.load(file)
+        with open(file_path, "rb") as file:
+            return _json_loads(file.read())
     except FileNotFoundError:
         raise
     except json.JSONDecodeError as e:
@@ -135,9 +208,44 @@ def expand_placeholders(
         >>> expand_placeholders("そのままの文", {"X": ["A", "B"]})
         ["そのままの文"]
     """
+    if "{" not in text:
+        return [text]
+    if any("{" in value or "}" in value for values in placeholders.values() for value in values):
+        # 置換候補自体がプレースホルダを含む場合は、順に置換して入れ子も展開する
+        return _expand_tokens(text, ((f"{{{ph}}}", values) for ph, values in placeholders.items()))
+    return _expand_segments(text, placeholders)
+
+# "{KEY}" 形式のプレースホルダ（split でリテラル部分と KEY を交互に取り出す）
+_PLACEHOLDER_RE: Pattern[str] = re.compile(r"\{([^{}]*)\}")
+
+def _expand_segments(text: str, placeholders: Dict[str, Sequence[str]]) -> List[str]:
+    """
+    テンプレートを一度だけリテラルとプレースホルダに分割し、含まれるプレースホルダの
+    置換候補の組み合わせを itertools.product で作ります。
+    組み合わせの順序は辞書順に置換していく _expand_tokens と同じです。
+    """
+    segments = _PLACEHOLDER_RE.split(text)
+    names = segments[1::2]
+    present = [ph for ph in placeholders if ph in names]
+    if not present:
+        return [text]
+    # 辞書にないプレースホルダは元の表記のまま残す
+    for i in range(1, len(segments), 2):
+        if segments[i] not in placeholders:
+            segments[i] = f"{{{segments[i]}}}"
+    slots = [[i for i in range(1, len(segments), 2) if segments[i] == ph] for ph in present]
+    results: List[str] = []
+    for combo in itertools.product(*(placeholders[ph] for ph in present)):
+        for indices, value in zip(slots, combo):
+            for i in indices:
+                segments[i] = value
+        results.append("".join(segments))
+    return results
+
+def _expand_tokens(text: str, tokens: Iterable[Tuple[str, Sequence[str]]]) -> List[str]:
+    """(トークン, 置換候補) の組を順に適用してプレースホルダを展開します。"""
     results: List[str] = [text]
-    for ph, values in placeholders.items():
-        token = f"{{{ph}}}"
+    for token, values in tokens:
         new_results: List[str] = []
         for item in results:
             if token in item:
@@ -148,7 +256,16 @@ def expand_placeholders(
         results = new_results
     return results
 
+@functools.lru_cache(maxsize=4096)
+def _expand_default_placeholders(text: str) -> Tuple[str, ...]:
+    """
+    config.PLACEHOLDER_VALUES で展開した結果を返します。
+    同じ対象ワード・除外表現が繰り返し展開されるため、結果をキャッシュします。
+    """
+    return tuple(expand_placeholders(text, PLACEHOLDER_VALUES))
+
 # --- 文字正規化・変換系 ---
+@functools.lru_cache(maxsize=256)
 def normalize_text(text: str) -> str:
     """
     広告文を正規化します。
@@ -167,12 +284,46 @@ def normalize_text(text: str) -> str:
         >>> normalize_text("Hello　　WORLD  TEST")
         "hello world test"
     """
-    normalized = ''.join(_basic_normalize_char(ch) for ch in text)
+    # 1文字ずつの正規化をテーブルで一括変換する（ASCII のみなら小文字化だけで同じ結果になる）
+    normalized = text.lower() if text.isascii() else text.translate(_NORMALIZE_TABLE)
     # 連続した ASCII スペースを単一スペースにまとめる
-    normalized = re.sub(r'(?<=\S) +(?=\S)', ' ', normalized)
+    normalized = _SPACE_RUN.sub(' ', normalized)
     return normalized
 
 # --- 内部マッチング用正規化＆マッピング作成 ---
+@functools.lru_cache(maxsize=256)
+def _normalize_for_matching(text: str) -> Tuple[str, Sequence[int]]:
+    """
+    normalize_text_for_matching の本体。同じ広告文を何度も正規化しないようキャッシュします。
+    mapping は 1 要素 4 バイトの array.array('i') で返します（キャッシュと共有されるため、呼び出し側で書き換えないこと）。
+    """
+    normalized_chars: List[str] = []
+    mapping = array.array('i')
+    # 全角→半角・小文字化・カタカナ→ひらがなを一括変換（ASCII のみなら小文字化だけで同じ結果になる）
+    folded = text.lower() if text.isascii() else text.translate(_MATCHING_TABLE)
+    if len(folded) == len(text):
+        # 文字数が変わらなければ 1 文字ずつ対応している
+        # 空白の連続ごとに、その手前までの位置を range でまとめて追加する
+        last = 0
+        for m in _WHITESPACE_RUN.finditer(folded):
+            mapping.extend(range(last, m.start()))
+            last = m.end()
+        mapping.extend(range(last, len(folded)))
+        return _WHITESPACE_RUN.sub('', folded), mapping
+
+    # NFC で複数文字に分解される文字を含む場合は、1文字ずつ対応を取る
+    for orig_idx, ch in enumerate(text):
+        ch_norm = _MATCHING_TABLE[ord(ch)]
+        # 空白は除去
+        if ch_norm.isspace():
+            continue
+        # 文字と対応元インデックスを追加
+        normalized_chars.append(ch_norm)
+        mapping.append(orig_idx)
+
+    normalized_text = ''.join(normalized_chars)
+    return normalized_text, mapping
+
 def normalize_text_for_matching(
     text: str,
 ) -> Tuple[str, List[int]]:
@@ -202,22 +353,8 @@ def normalize_text_for_matching(
         >>> normalize_text_for_matching("ＡＢ Ｃ")
         ("ab c", [0, 1, 3])
     """
-    normalized_chars: List[str] = []
-    mapping: List[int] = []
-    for orig_idx, ch in enumerate(text):
-        ch_norm = _basic_normalize_char(ch)
-        # カタカナ→ひらがな
-        if 'ァ' <= ch_norm <= 'ン':
-            ch_norm = chr(ord(ch_norm) - 0x60)
-        # 空白は除去
-        if ch_norm.isspace():
-            continue
-        # 文字と対応元インデックスを追加
-        normalized_chars.append(ch_norm)
-        mapping.append(orig_idx)
-
-    normalized_text = ''.join(normalized_chars)
-    return normalized_text, mapping
+    normalized_text, mapping = _normalize_for_matching(text)
+    return normalized_text, mapping.tolist()
 
 def convert_to_hiragana_preserving_katakana(text: str) -> str:
     """
@@ -233,10 +370,7 @@ def convert_to_hiragana_preserving_katakana(text: str) -> str:
         >>> convert_to_hiragana_preserving_katakana("あいうアイウ")
         "アイウアイウ"
     """
-    return ''.join(
-        chr(ord(c) - 0x60) if 'ァ' <= c <= 'ン' else c
-        for c in text
-    )
+    return text.translate(_KATA_TO_HIRA)
 
 def convert_to_katakana(text: str) -> str:
     """
@@ -252,15 +386,58 @@ def convert_to_katakana(text: str) -> str:
         >>> convert_to_katakana("あいうえおアイウ")
         "アイウエオアイウ"
     """
-    # ひらがな(U+3041–U+3096)を対応するカタカナ(U+30A1–U+30F6)に変換
-    return text.translate(str.maketrans("ぁあぃいぅうぇえぉおかがきぎくぐけげこごさざしじすずせぜそぞ\
-ただちぢっつづてでとどなにぬねのはばぱひびぴふぶぷへべぺほぼぽ\
-まみむめもやゃゆゅよょらりるれろわゐゑをんゔゕゖ",
-                                         "ァアィイゥウェエォオカガキギクグケゲコゴサザシジスズセゼソゾ\
-タダチヂッツヅテデトドナニヌネノハバパヒビピフブプヘベペホボポ\
-マミムメモヤャユュヨョラリルレロワヰヱヲンヴヵヶ"))
+    return text.translate(_HIRA_TO_KATA)
+
+# compile_ng_word 用：NGワード中の「\d+」と、ひらがな1文字→[ひらがなカタカナ] の文字クラス
+_DIGIT_META: Pattern[str] = re.compile(r'\\d\+')
+_DIGIT_CLASS: str = "[0-9０-９]"
+# 原子グループ (?>...) は Python 3.11 以降で使える
+_ATOMIC_GROUPS: bool = sys.version_info >= (3, 11)
+
+
+def _digit_run(match: Match[str]) -> str:
+    """
+    NGワード中の「\\d+」を全角数字も含む数字列パターンに置き換える。
+    長い数字列を含む広告文で、数字列の途中からの照合や桁の取り直し（バックトラック）を繰り返さないようにする。
+    """
+    run = f"{_DIGIT_CLASS}+"
+    following = match.string[match.end():match.end() + 1]
+    quantifier = match.string[match.end() + 1:match.end() + 2]
+    # 直後が数字になり得ない（省略もされない）リテラルでなければ、そのまま返す
+    if (
+        not following
+        or following in _REGEX_META
+        or following.isdigit()
+        or (quantifier and quantifier in "?*{")
+    ):
+        return run
+    # 桁を取り直しても直後のリテラルには一致しないので、原子グループにする
+    if _ATOMIC_GROUPS:
+        run = f"(?>{run})"
+    # 先頭の数字列は、数字列の途中から始まる一致があれば数字列の頭からも一致する（そちらが先に見つかる）ため、
+    # 数字の直後からは照合を始めない。
+    # ただし直前の一致が数字で終わると、finditer の次の照合は数字列の途中から始まるので、
+    # 一致が必ず数字以外のリテラルで終わるパターン（末尾が通常の文字で「|」を含まない）に限る
+    if match.start() == 0 and _ends_with_non_digit_literal(match.string):
+        run = f"(?<!{_DIGIT_CLASS}){run}"
+    return run
+
+def _ends_with_non_digit_literal(pattern: str) -> bool:
+    """パターンの一致が必ず数字以外の 1 文字で終わるか（判定できない場合は False）。"""
+    last = pattern[-1:]
+    return (
+        bool(last)
+        and last not in _REGEX_META
+        and not last.isdigit()
+        and pattern[-2:-1] != "\\"
+        and "|" not in pattern
+    )
 
-@functools.lru_cache(maxsize=128)
+_HIRA_CHAR_CLASS: Dict[int, str] = {
+    cp: f"[{chr(cp)}{chr(cp + 0x60)}]" for cp in range(ord("ぁ"), ord("ん") + 1)
+}
+
+@functools.lru_cache(maxsize=4096)
 def compile_ng_word(phrase: str) -> Pattern[str]:
     """
     指定されたNGワードを正規化し、正規表現パターンにコンパイルして返します。
@@ -282,60 +459,147 @@ def compile_ng_word(phrase: str) -> Pattern[str]:
         True
     """
     # NGワードを内部マッチング用に正規化する
-    phrase_normalized, _ = normalize_text_for_matching(phrase)
+    phrase_normalized, _ = _normalize_for_matching(phrase)
     
     # 数字部分やひらがなをパターン化
-    pattern_str = re.sub(r'\\d\+', r"[0-9０-９]+", phrase_normalized)
-    pattern_str = re.sub(
-        r'[ぁ-ん]',
-        lambda m: f"[{m.group(0)}{chr(ord(m.group(0)) + 0x60)}]",
-        pattern_str
-    )
-    pattern_str = re.sub(r'\s+', r'\\s*', pattern_str)
+    # （空白は正規化で除去済みのため、空白→\s* の置換は不要）
+    pattern_str = phrase_normalized
+    if "\\d+" in pattern_str:
+        pattern_str = _DIGIT_META.sub(_digit_run, pattern_str)
+    pattern_str = pattern_str.translate(_HIRA_CHAR_CLASS)
 
     try:
         return re.compile(pattern_str, re.IGNORECASE)
     except re.error as e:
         # エラーログを残してフォールバック
-        logging.warning(
+        logger.warning(
             "Regex compilation failed for pattern '%s': %s. Falling back to escaped phrase.",
             pattern_str, e
         )
         # フォールバック：特殊文字をエスケープして再コンパイル
         return re.compile(re.escape(phrase_normalized), re.IGNORECASE)
 
+# 正規表現のメタ文字（必須リテラル抽出用）
+_REGEX_META: str = "\\.^$*+?{}[]()|"
+
+@functools.lru_cache(maxsize=4096)
+def _required_literal(phrase: str) -> str:
+    """
+    NGワードがマッチするとき、正規化済みテキスト中に必ず現れる先頭の固定文字列を返します。
+    全パターンの正規表現を走査する前に、C 実装の部分文字列検索で候補を絞り込むために使います。
+
+    Args:
+        phrase (str): NGワード文字列（正規表現のメタ文字を含んでもよい）。
+
+    Returns:
+        str: casefold 済みの必須リテラル。抽出できない場合は空文字列。
+
+    Examples:
+        >>> _required_literal("肌(の)?疲れ")
+        "肌"
+        >>> _required_literal("たった\\d+日で")
+        "たった"
+    """
+    phrase_normalized, _ = _normalize_for_matching(phrase)
+    # トップレベルの「|」があると先頭リテラルが必須とは限らない
+    # （\x のエスケープと [...] の文字クラス内の括弧・| はグループとして数えない）
+    depth = 0
+    i, n = 0, len(phrase_normalized)
+    while i < n:
+        ch = phrase_normalized[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == "[":
+            # 文字クラスの終わりまで読み飛ばす（先頭の ^ と直後の ] はクラスの一部）
+            i += 1
+            if i < n and phrase_normalized[i] == "^":
+                i += 1
+            if i < n and phrase_normalized[i] == "]":
+                i += 1
+            while i < n and phrase_normalized[i] != "]":
+                i += 2 if phrase_normalized[i] == "\\" else 1
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return ""
+        i += 1
+    literal: List[str] = []
+    for ch in phrase_normalized:
+        if ch in _REGEX_META:
+            # 直後が ? * {} の文字は省略され得るので除外する
+            if ch in "?*{" and literal:
+                literal.pop()
+            break
+        literal.append(ch)
+    return "".join(literal).casefold()
+
+# --- 照合用に前処理済みの NGワード辞書 ---
+class NGWordTable(Dict[str, NGWordDetail]):
+    """
+    NGワード辞書（キー → NGWordDetail）に、照合用の前処理結果を持たせた dict。
+
+    キーの長い順に並べた (必須リテラル, パターン, 詳細) のリストと、コンパイル済みの
+    除外パターンを構築時に一度だけ作り、check_advertisement_with_categories_masking が
+    広告文ごとに並べ替えやコンパイルを繰り返さずに済むようにします。
+    構築後に要素を書き換えた場合は、NGWordTable(table) で作り直してください。
+    """
+
+    def __init__(self, ng_words: Optional[Dict[str, NGWordDetail]] = None) -> None:
+        super().__init__(ng_words or {})
+        self.sorted_entries: List[Tuple[str, Pattern[str], NGWordDetail]] = []
+        # 長いワードから順に照合する
+        for _, details in sorted(self.items(), key=lambda x: -len(x[0])):
+            # pattern がなければ original からコンパイルしてフォールバック
+            pattern = details.get("pattern")
+            if not isinstance(pattern, re.Pattern):
+                pattern = compile_ng_word(details["original"])
+            literal = details.get("literal")
+            if literal is None:
+                literal = _required_literal(details["original"])
+            self.sorted_entries.append((literal, pattern, details))
+        self.exclusion_patterns: Tuple[Pattern[str], ...] = _compile_exclusion_patterns(
+            _collect_exclusions(self)
+        )
+
 # --- サブカテゴリ分け用定数 ---
 GLOBAL_CATEGORY_NAME: str = "化粧品等"
 COMMON_SUBCATEGORIES: List[str] = ["共通"]
 GENERAL_SUBCATEGORIES: List[str] = ["一般"]
 MEDICINAL_SUBCATEGORIES: List[str] = ["薬用"]
+# サブカテゴリ名の振り分け規則（先に一致したものを優先。どれにも一致しなければ「共通」）
+_SUBCATEGORY_CLASSIFIERS: Tuple[Tuple[Pattern[str], str], ...] = tuple(
+    (re.compile("|".join(map(re.escape, keywords))), group)
+    for keywords, group in (
+        (COMMON_SUBCATEGORIES, "共通"),
+        (GENERAL_SUBCATEGORIES, "一般化粧品"),
+        (MEDICINAL_SUBCATEGORIES, "薬用化粧品"),
+    )
+)
 
 def extract_ng_data_by_subcategory(
     data: Dict[str, Any]
 ) -> Dict[str, List[Dict[str, Any]]]:
     
-    common_data: List[Dict[str, Any]] = []
-    general_data: List[Dict[str, Any]] = []
-    medicinal_data: List[Dict[str, Any]] = []
+    grouped: Dict[str, List[Dict[str, Any]]] = {
+        "共通": [],
+        "一般化粧品": [],
+        "薬用化粧品": [],
+    }
     
     for global_cat in data.get("global_categories", []):
         if global_cat.get("name") == GLOBAL_CATEGORY_NAME:
             for sub_cat in global_cat.get("subcategories", []):
                 sub_cat_name = sub_cat.get("name", "")
-                if any(keyword in sub_cat_name for keyword in COMMON_SUBCATEGORIES):
-                    common_data.append(sub_cat)
-                elif any(keyword in sub_cat_name for keyword in GENERAL_SUBCATEGORIES):
-                    general_data.append(sub_cat)
-                elif any(keyword in sub_cat_name for keyword in MEDICINAL_SUBCATEGORIES):
-                    medicinal_data.append(sub_cat)
-                else:
-                    common_data.append(sub_cat)
+                group = next(
+                    (group for pattern, group in _SUBCATEGORY_CLASSIFIERS if pattern.search(sub_cat_name)),
+                    "共通",
+                )
+                grouped[group].append(sub_cat)
                     
-    return {
-        "共通": common_data,
-        "一般化粧品": general_data,
-        "薬用化粧品": medicinal_data
-    }
+    return grouped
 
 def extract_ng_data_from_subcategories(
     subcategory_data: Dict[str, List[Dict[str, Any]]],
@@ -343,10 +607,10 @@ def extract_ng_data_from_subcategories(
     selected_product: Optional[str] = None,
     # JSONの「一般」か「薬用」を選択
     category_type: str = "一般",
-) -> Dict[str, NGWordDetail]:
+) -> NGWordTable:
     
     # デバッグ出力
-    logger.debug(f"selected_usage={selected_usage}, selected_product={selected_product}")
+    logger.debug("selected_usage=%s, selected_product=%s", selected_usage, selected_product)
 
     ng_words: Dict[str, NGWordDetail] = {}
     for group_name, subcategories in subcategory_data.items():
@@ -398,7 +662,7 @@ def extract_ng_data_from_subcategories(
                 exclusion_list = item.get("除外表現", [])
 
                 for word in item.get("対象ワード", []):
-                    for final_word in expand_placeholders(word, PLACEHOLDER_VALUES):
+                    for final_word in _expand_default_placeholders(word):
                         ng_key = f"{final_word}::{category_str}"
                         if not final_word or ng_key in ng_words:
                             continue
@@ -406,6 +670,7 @@ def extract_ng_data_from_subcategories(
                         ng_words[ng_key] = {
                             "original": final_word,
                             "pattern": pattern,
+                            "literal": _required_literal(final_word),
                             "category": category_str,
                             "指摘事項": reason,
                             "改善提案": suggestion,
@@ -417,42 +682,80 @@ def extract_ng_data_from_subcategories(
                             "用途区分": item_usages,
                         }
 
-    return ng_words
+    return NGWordTable(ng_words)
 
 # NGワード抽出のキャッシュ化
-def get_ng_word_data(file_path: str) -> Dict[str, NGWordDetail]:
+def get_ng_word_data(file_path: str) -> NGWordTable:
+    
+    # ファイルの更新時刻をキーに含め、JSON が編集されたら自動で作り直す
+    # （返り値はキャッシュと共有されるため、呼び出し側で書き換えないこと）
+    return _get_ng_word_data_cached(file_path, os.stat(file_path).st_mtime_ns)
+
+@functools.lru_cache(maxsize=4)
+def _get_ng_word_data_cached(file_path: str, mtime_ns: int) -> NGWordTable:
     
     data = load_json(file_path)
     subcategory_data = extract_ng_data_by_subcategory(data)
     # ここでは「共通」キーのみを対象に NG ワードマッピングを構築
     return extract_ng_data_from_subcategories({"共通": subcategory_data["共通"]})
 
+def _collect_exclusions(ng_words: Dict[str, NGWordDetail]) -> Tuple[str, ...]:
+    """
+    NGワード辞書に含まれる除外表現を、プレースホルダー展開・重複除去して出現順に返す。
+    """
+    processed_exclusions: Dict[str, None] = {}
+    for details in ng_words.values():
+        # 除外表現リストを取得し、各除外表現に対してプレースホルダー展開を行う
+        for safe_expr in details.get("除外表現", []):
+            for expr in _expand_default_placeholders(safe_expr):
+                processed_exclusions.setdefault(expr)
+    return tuple(processed_exclusions)
+
+@functools.lru_cache(maxsize=32)
+def _compile_exclusion_patterns(exclusions: Tuple[str, ...]) -> Tuple[Pattern[str], ...]:
+    """
+    除外表現を出現順にコンパイルする（NGワード辞書ごとに一度だけ）。
+
+    除外表現同士が重なる場合のマスク結果を変えないよう、ひとつの選択パターンには結合せず、
+    mask_safe_expressions で表現ごとに順番に置換する。
+
+    Args:
+        exclusions (Tuple[str, ...]): 展開済み・重複除去済みの除外表現
+    Returns:
+        Tuple[Pattern[str], ...]: 表現ごとのパターン（出現順）。除外表現がなければ空。
+    """
+    patterns: List[Pattern[str]] = []
+    for expr in exclusions:
+        # 除外表現を正規表現としてコンパイルする（re.escapeを使わない）
+        try:
+            patterns.append(re.compile(expr, re.IGNORECASE))
+        except re.error:
+            # もしコンパイルエラーが発生したら、リテラルとして扱う
+            patterns.append(re.compile(re.escape(expr), re.IGNORECASE))
+    return tuple(patterns)
+
+# マスク用の「□」の列（よく使う長さは事前に作っておく）
+_MASK_STRINGS: List[str] = ["□" * n for n in range(256)]
+
+def _mask_match(m: Match[str]) -> str:
+    """一致した部分と同じ文字数の「□」を返す（re.sub の置換関数）。"""
+    n = m.end() - m.start()
+    return _MASK_STRINGS[n] if n < 256 else "□" * n
+
 def mask_safe_expressions(
     ad_text: str, 
     ng_words: Dict[str, NGWordDetail],
 ) -> str:
     
+    # NGWordTable なら構築時にコンパイル済みの除外パターンを使い、出現順に 1 表現ずつマスクする
+    if isinstance(ng_words, NGWordTable):
+        patterns = ng_words.exclusion_patterns
+    else:
+        patterns = _compile_exclusion_patterns(_collect_exclusions(ng_words))
     masked_text: str = ad_text
-    processed_exclusions: Set[str] = set()
-    for details in ng_words.values():
-        # 除外表現リストを取得
-        exclusion_list: List[str] = details.get("除外表現", [])
-        # 各除外表現に対して、プレースホルダー展開を行う
-        for safe_expr in exclusion_list:
-            expanded_safe_exprs = expand_placeholders(safe_expr, PLACEHOLDER_VALUES)
-            for expr in expanded_safe_exprs:
-                # 同じ表現を複数回処理しないようにチェック
-                if expr in processed_exclusions:
-                    continue
-                processed_exclusions.add(expr)
-                # 除外表現を正規表現としてコンパイルする（re.escapeを使わない）
-                try:
-                    pattern = re.compile(expr, re.IGNORECASE)
-                except re.error:
-                    # もしコンパイルエラーが発生したら、リテラルとして扱う
-                    pattern = re.compile(re.escape(expr), re.IGNORECASE)
-                # マッチした部分の文字数に合わせて「□」を生成する
-                masked_text = pattern.sub(lambda m: "□" * len(m.group()), masked_text)
+    for pattern in patterns:
+        # マッチした部分の文字数に合わせて「□」に置き換える
+        masked_text = pattern.sub(_mask_match, masked_text)
     return masked_text
 
 
@@ -462,7 +765,7 @@ def check_advertisement_with_categories_masking(
 ) -> List[ViolationItem]:
     
     # 1) 正規化＆マッピング
-    normalized_text, mapping = normalize_text_for_matching(ad_text)
+    normalized_text, mapping = _normalize_for_matching(ad_text)
 
     #st.write("正規化後のテキスト:", ad_text_normalized)  # デバッグ出力
 
@@ -472,22 +775,26 @@ def check_advertisement_with_categories_masking(
     #st.write("マスク済みのテキスト:", masked_text)  # ここを追加して確認
 
     detected_violations: List[ViolationItem] = []
-    matched_positions: Set[Tuple[int, int]] = set()
-
-    # 3) 長いワードから順にNGワードパターンを検索
-    sorted_ng_words = sorted(ng_words.items(), key=lambda x: -len(x[0]))
-    for _, details in sorted_ng_words:
-        # pattern がなければ original からコンパイルしてフォールバック
-        if "pattern" in details and isinstance(details["pattern"], re.Pattern):
-            phrase_pattern = details["pattern"]
-        else:
-            phrase_pattern = compile_ng_word(details["original"])  
+    # 採用済みの一致範囲を 1 文字 1 バイトで記録し、重なり判定をスライス確認で済ませる
+    matched_mask = bytearray(len(masked_text))
+    # 必須リテラルの絞り込み用（IGNORECASE 相当で比較するため casefold）
+    haystack = masked_text.casefold()
+
+    # 3) 長いワードから順にNGワードパターンを検索（並び順は NGWordTable が保持）
+    table = ng_words if isinstance(ng_words, NGWordTable) else NGWordTable(ng_words)
+    for literal, phrase_pattern, details in table.sorted_entries:
+        # 必須リテラルが本文に無いワードは正規表現を走らせずに飛ばす
+        if literal and literal not in haystack:
+            continue
         for match in phrase_pattern.finditer(masked_text):
             start, end = match.start(), match.end()
+            # 長さ 0 の一致（「x?」「a*」など）は指摘する表現がなく、マスクでも重なりを判定できないので採用しない
+            if start == end:
+                continue
             # 重複或いは重なりを避ける
-            if any(start < e and end > s for s, e in matched_positions):
+            if any(matched_mask[start:end]):
                 continue
-            matched_positions.add((start, end))
+            matched_mask[start:end] = b"\x01" * (end - start)
 
             # 4) マッピングで元テキスト上の位置に変換
             orig_start = mapping[start]
@@ -509,23 +816,64 @@ def check_advertisement_with_categories_masking(
     detected_violations.sort(key=lambda x: x["開始位置"])
     return detected_violations
 
+# ハイライト用のタグ
+_HIGHLIGHT_OPEN: str = "<span style='background-color:#FFCCCC; color:red; font-weight:bold;'>"
+_HIGHLIGHT_CLOSE: str = "</span>"
+
 def highlight_prohibited_phrases(
     ad_text: str, 
     violations: List[ViolationItem],
 ) -> str:
     
-    highlighted_text: str = ""
+    # 断片をリストに集めて最後に一度だけ連結する
+    # 広告文はそのまま HTML として表示されるため、各断片はエスケープしてから埋め込む
+    parts: List[str] = []
     last_end: int = 0
     for violation in sorted(violations, key=lambda x: x['開始位置']):
         start, end = violation['開始位置'], violation['終了位置']
-        highlighted_text += ad_text[last_end:start]
-        highlighted_text += (
-            f"<span style='background-color:#FFCCCC; color:red; font-weight:bold;'>"
-            f"{ad_text[start:end]}</span>"
-        )
+        parts.append(html.escape(ad_text[last_end:start], quote=False))
+        parts.append(_HIGHLIGHT_OPEN)
+        parts.append(html.escape(ad_text[start:end], quote=False))
+        parts.append(_HIGHLIGHT_CLOSE)
         last_end = end
-    highlighted_text += ad_text[last_end:]
-    return highlighted_text
+    parts.append(html.escape(ad_text[last_end:], quote=False))
+    return "".join(parts)
+
+@functools.lru_cache(maxsize=64)
+def _ingredient_context_patterns(
+    ingredient_placeholder: str,
+    effect_placeholder: str,
+    exclusion_placeholder: Optional[str],
+) -> Tuple[Tuple[Tuple[str, Pattern[str]], ...], Optional[Pattern[str]], Tuple[Pattern[str], ...]]:
+    """
+    check_ingredient_context 用に、プレースホルダーを展開・正規化した検索パターンを作る。
+
+    Returns:
+        Tuple: (元の成分名とその検索パターンの組, 効果表現のいずれかに一致するパターン, 除外表現ごとのパターン)
+            効果表現が1つもなければ 2 番目は None
+    """
+    # 対象成分：成分ごとに一致位置が重なり得るため、バリエーションごとに個別のパターンを持つ
+    ingredient_patterns = tuple(
+        (ing, re.compile(re.escape(_normalize_for_matching(ing)[0]), re.IGNORECASE))
+        for ing in _expand_default_placeholders(ingredient_placeholder)
+    )
+    # 効果表現：文脈中にどれか1つあればよいので、選択パターン1つにまとめる
+    effect_variants = _expand_default_placeholders(effect_placeholder)
+    effect_pattern = (
+        re.compile(
+            "|".join(re.escape(_normalize_for_matching(eff)[0]) for eff in effect_variants),
+            re.IGNORECASE,
+        )
+        if effect_variants else None
+    )
+    # 除外表現が指定されている場合は展開
+    exclusion_patterns: Tuple[Pattern[str], ...] = ()
+    if exclusion_placeholder is not None:
+        exclusion_patterns = tuple(
+            re.compile(re.escape(excl), re.IGNORECASE)
+            for excl in _expand_default_placeholders(exclusion_placeholder)
+        )
+    return ingredient_patterns, effect_pattern, exclusion_patterns
 
 # チェック対象成分の文脈を検証する関数（特定成分の配合目的の記載確認用）
 def check_ingredient_context(
@@ -536,44 +884,41 @@ def check_ingredient_context(
     window: int = 80
 ) -> List[ViolationItem]:
     
-    # プレースホルダーの対象成分と効果表現のバリエーションを取得
-    ingredient_variants = expand_placeholders(ingredient_placeholder, PLACEHOLDER_VALUES)
-    effect_variants = expand_placeholders(effect_placeholder, PLACEHOLDER_VALUES)
-    
-    # 正規化バージョンを準備
-    normalized_ingredient_variants = [normalize_text_for_matching(ing)[0] for ing in ingredient_variants]
-    normalized_effect_variants = [normalize_text_for_matching(eff)[0] for eff in effect_variants]
-    
-    # 除外表現が指定されている場合は展開
-    exclusion_variants: List[str] = []
-    if exclusion_placeholder is not None:
-        exclusion_variants = expand_placeholders(exclusion_placeholder, PLACEHOLDER_VALUES)
+    # プレースホルダーの対象成分・効果表現・除外表現を展開・正規化済みのパターンとして取得
+    ingredient_patterns, effect_pattern, exclusion_patterns = _ingredient_context_patterns(
+        ingredient_placeholder, effect_placeholder, exclusion_placeholder
+    )
     
     violations_list: List[ViolationItem] = []
-    normalized_text, mapping = normalize_text_for_matching(ad_text)
+    normalized_text, mapping = _normalize_for_matching(ad_text)
+
+    # 入力文中の除外表現の一致範囲は成分の一致ごとに変わらないため、先に一度だけ求めておく
+    # 開始位置順に並べ、各位置までの終了位置の最大値を持っておく（包含判定を二分探索で行う）
+    exclusion_spans: List[Tuple[int, int]] = sorted(
+        m_excl.span()
+        for excl_pattern in exclusion_patterns
+        for m_excl in excl_pattern.finditer(normalized_text)
+    )
+    exclusion_starts: List[int] = [s for s, _ in exclusion_spans]
+    exclusion_max_ends: List[int] = list(itertools.accumulate((e for _, e in exclusion_spans), max))
     
-    # 元の成分と正規化した成分のペアでループ
-    for orig_ing, norm_ing in zip(ingredient_variants, normalized_ingredient_variants):
-        for match in re.finditer(re.escape(norm_ing), normalized_text, re.IGNORECASE):
+    # 元の成分とその検索パターンの組でループ
+    for orig_ing, ing_pattern in ingredient_patterns:
+        for match in ing_pattern.finditer(normalized_text):
             start, end = match.start(), match.end()
             window_start = max(0, start - window)
             window_end = min(len(normalized_text), end + window)
             context = normalized_text[window_start:window_end]
             
             # 除外判定：対象成分の一致が、入力文中のいずれかの除外表現に完全に含まれているか
-            excluded = False
-            for excl in exclusion_variants:
-                for m_excl in re.finditer(re.escape(excl), normalized_text, re.IGNORECASE):
-                    if m_excl.start() <= start and m_excl.end() >= end:
-                        excluded = True
-                        break
-                    if excluded:
-                        break
+            # 開始位置が start 以前の除外表現のうち、最も後ろまで届くものが end を覆っていれば除外
+            i = bisect.bisect_right(exclusion_starts, start) - 1
+            excluded = i >= 0 and exclusion_max_ends[i] >= end
             if excluded:
                 continue  # 除外対象なのでチェックしない
             
             # 効果表現のチェック（こちらも正規化済みのものを使用）
-            if not any(re.search(re.escape(norm_eff), context, re.IGNORECASE) for norm_eff in normalized_effect_variants):
+            if effect_pattern is None or not effect_pattern.search(context):
                 orig_start = mapping[start]
                 orig_end = mapping[end - 1] + 1
                 violations_list.append({
@@ -5,20 +5,86 @@ json_export_script.py
 NGword マスター (MergedMaster シート) と Markdown ファイルから JSON を生成するスクリプト
 Markdownファイルの不足 → エラー
 """
+import hashlib
+import io
 import os
 import json
+import pickle
 import re
 from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import numpy as np
 import pandas as pd
 
+# python-calamine があれば Rust 実装のリーダーで Excel を読み込む（なければ pandas 既定の openpyxl）
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = None
+
+# orjson があれば JSON の書き出しに使う（出力内容は json.dump(indent=2, ensure_ascii=False) と同一）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # 定数・設定
 EXCEL_FILE      = 'NGwordマスタ.xlsm'
 SHEET_TABLE     = 'MergedMaster'
 MD_DIR          = './markdown_texts/'
 OUTPUT_JSON     = 'NGword.json'
+CACHE_DIR       = Path.home() / '.cache' / 'yakkiho-checker'
 PARENT_CAT_ID   = 'CAT001'
 PARENT_CAT_NAME = '化粧品等'
 
+# JSON 生成で参照する列（それ以外の列は Excel 読み込み時に読み飛ばす）
+_KEY_COLUMNS     = ('サブカテゴリID', 'サブカテゴリ名', 'グループID', 'グループ名', '除外表現')
+_COLUMN_PREFIXES = ('用途_', '製品_', '対象ワード', '理由_', '改善提案_', '適正表現例_')
+
+# Markdown パース用の正規表現（ファイル・行ごとに組み立て直さないよう事前コンパイル）
+_HEADER_RE = re.compile(r'^###\s+(.*)')
+_BULLET_RE = re.compile(r'^[\-\u30FB]\s*')
+# セル内リストの区切り文字
+_SPLIT_RE  = re.compile(r'[,;；]')
+
+
+def is_used_column(name) -> bool:
+    """
+    MergedMaster の列のうち JSON 生成で参照する列かどうか
+    """
+    name = str(name)
+    return name in _KEY_COLUMNS or name.startswith(_COLUMN_PREFIXES)
+
+
+def read_master_table(path: str, sheet_name: str) -> pd.DataFrame:
+    """
+    Excel マスターのシートを DataFrame で返す
+    (パス, 更新時刻, サイズ, シート名, pandas バージョン, 読み込みエンジン, 読み込む列) を
+    キーにした pickle を CACHE_DIR に保存し、Excel が更新されていなければ読み込みを省略する
+    """
+    st = os.stat(path)
+    key = (f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}:{sheet_name}"
+           f":{pd.__version__}:{EXCEL_ENGINE}:{_KEY_COLUMNS}:{_COLUMN_PREFIXES}")
+    cache_path = CACHE_DIR / f"master_{hashlib.md5(key.encode('utf-8')).hexdigest()}.pkl"
+    try:
+        return pickle.loads(cache_path.read_bytes())
+    except Exception:
+        # 読めないキャッシュ（別バージョンの pandas で書いたものなど）は使わずに Excel を読み直す
+        pass
+    df = pd.read_excel(path, sheet_name=sheet_name, engine=EXCEL_ENGINE, usecols=is_used_column)
+    # キャッシュは高速化のためだけなので、書き込みに失敗しても処理は続ける
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # 古いキャッシュは使われないので、新しいものだけを残す
+        for old_cache in CACHE_DIR.glob('master_*.pkl'):
+            if old_cache != cache_path:
+                old_cache.unlink(missing_ok=True)
+        cache_path.write_bytes(pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError as e:
+        print(f"Warning: cache not written: {e}")
+    return df
+
 
 def parse_markdown(subcat_id: str, subcat_name: str) -> dict:
     """
@@ -32,34 +98,36 @@ def parse_markdown(subcat_id: str, subcat_name: str) -> dict:
     filename = f"{subcat_name}.md"
     path = os.path.join(MD_DIR, filename)
     sections = {}
+    # セクションごとの箇条書き項目（行の振り分けと同じ走査で抽出する）
+    list_items = {}
     current = None
     if not os.path.exists(path):
         print(f"Warning: Markdown file not found: {path}")
         return {'概要':'', 'common_ng':[], 'laws':[], 'notes':[]}
-    with open(path, 'r', encoding='utf-8') as f:
+    # ファイル全体を一度に読み込み、行単位の振り分けはメモリ上で行う
+    with io.StringIO(Path(path).read_text(encoding='utf-8')) as f:
         for line in f:
-            header = re.match(r'^###\s+(.*)', line)
+            # 見出し候補の行だけ正規表現で判定する
+            header = _HEADER_RE.match(line) if line.startswith('###') else None
             if header:
                 current = header.group(1).strip()
                 sections[current] = []
+                list_items[current] = []
             else:
                 if current:
                     sections[current].append(line.rstrip('\n'))
-    # ヘッダー名に合わせてキーを抽出
-    def parse_list(lines):
-        items = []
-        for l in lines:
-            if l.strip().startswith(('-', '・')):
-                item = re.sub(r'^[\-\u30FB]\s*', '', l.strip())
-                if item:
-                    items.append(item)
-        return items
+                    stripped = line.strip()
+                    if stripped.startswith(('-', '・')):
+                        item = _BULLET_RE.sub('', stripped)
+                        if item:
+                            list_items[current].append(item)
 
+    # ヘッダー名に合わせてキーを抽出
     result = {
         '概要':   '\n'.join(sections.get('概要', [])).strip(),
-        'common_ng': parse_list(sections.get('共通禁止事項', [])),
-        'laws':      parse_list(sections.get('関連法令等', [])),
-        'notes':     parse_list(sections.get('注意点', [])),
+        'common_ng': list_items.get('共通禁止事項', []),
+        'laws':      list_items.get('関連法令等', []),
+        'notes':     list_items.get('注意点', []),
     }
     return result
 
@@ -73,30 +141,25 @@ def parse_cell_list(cell):
     if isinstance(cell, list):
         return cell
     if isinstance(cell, str):
-        # JSON 形式リストの可能性
-        try:
-            val = json.loads(cell)
-            if isinstance(val, list):
-                return val
-        except:
-            pass
+        # JSON 形式リストの可能性（'[' で始まらなければリストにはならないので、デコードを試さない）
+        if cell.lstrip().startswith('['):
+            try:
+                val = json.loads(cell)
+                if isinstance(val, list):
+                    return val
+            except:
+                pass
         # 改行または区切り文字で分割
         lines = [l.strip() for l in cell.splitlines() if l.strip()]
         items = []
         for l in lines:
-            parts = re.split(r'[,;；]', l)
+            parts = _SPLIT_RE.split(l)
             for p in parts:
                 p2 = p.strip()
                 if p2:
                     items.append(p2)
-        # 重複を排除
-        seen = set()
-        unique = []
-        for i in items:
-            if i not in seen:
-                seen.add(i)
-                unique.append(i)
-        return unique
+        # 重複を排除（出現順を保持）
+        return list(dict.fromkeys(items))
     return [cell]
 
 
@@ -108,42 +171,55 @@ def build_ng_list(df_grp: pd.DataFrame, subcat_id: str) -> list:
     対象ワードは「対象ワード」列をすべて収集
     """
     ng_list = []
-    for group_id, grp in df_grp.groupby('グループID'):
-        group_name = grp['グループ名'].iloc[0]
-        # 用途列を動的に検出
-        usage_cols = [c for c in grp.columns if c.startswith('用途_')]
-        usage = [c.replace('用途_', '') for c in usage_cols if str(grp[c].iloc[0]).strip() == '〇']
-        # 製品列を動的に検出
-        product_cols = [c for c in grp.columns if c.startswith('製品_')]
-        products = [c.replace('製品_', '') for c in product_cols if str(grp[c].iloc[0]).strip() == '〇']
-        # 対象ワード列を動的に検出
-        target_cols = [c for c in grp.columns if c.startswith('対象ワード')]
+    # 用途・製品・対象ワード列を動的に検出（列構成はグループ間で共通なので一度だけ）
+    usage_cols   = [c for c in df_grp.columns if c.startswith('用途_')]
+    product_cols = [c for c in df_grp.columns if c.startswith('製品_')]
+    target_cols  = [c for c in df_grp.columns if c.startswith('対象ワード')]
+    # セル値は一度だけ配列として取り出し、以降は位置で参照する（グループごとの DataFrame 切り出しや .iloc を避ける）
+    values = df_grp.to_numpy(dtype=object)
+    col_pos = {c: i for i, c in enumerate(df_grp.columns)}
+    # 用途・製品列が〇かどうかを全行まとめて判定しておく
+    is_marked = np.frompyfunc(lambda v: str(v).strip() == '〇', 1, 1)
+    usage_flags   = is_marked(values[:, [col_pos[c] for c in usage_cols]])
+    product_flags = is_marked(values[:, [col_pos[c] for c in product_cols]])
+    usage_names   = [c.replace('用途_', '') for c in usage_cols]
+    product_names = [c.replace('製品_', '') for c in product_cols]
+
+    def first_cell(rows, col, default):
+        # グループ先頭行の値（列がなければ default）
+        return values[rows[0], col_pos[col]] if col in col_pos else default
+
+    group_rows = df_grp.groupby('グループID').indices
+    for group_id in sorted(group_rows):
+        rows = group_rows[group_id]
+        group_name = values[rows[0], col_pos['グループ名']]
+        # 用途・製品はグループ先頭行の〇を採用
+        usage = [name for name, flag in zip(usage_names, usage_flags[rows[0]]) if flag]
+        products = [name for name, flag in zip(product_names, product_flags[rows[0]]) if flag]
         targets = []
         for col in target_cols:
-            for cell in grp[col]:
+            for cell in values[rows, col_pos[col]]:
                 targets.extend(parse_cell_list(cell))
-        seen = set()
-        targets = [x for x in targets if not (x in seen or seen.add(x))]
+        targets = list(dict.fromkeys(targets))
         # 除外表現
         excludes = []
-        if '除外表現' in grp:
-            for cell in grp['除外表現']:
+        if '除外表現' in col_pos:
+            for cell in values[rows, col_pos['除外表現']]:
                 excludes.extend(parse_cell_list(cell))
-            seen2 = set()
-            excludes = [x for x in excludes if not (x in seen2 or seen2.add(x))]
+            excludes = list(dict.fromkeys(excludes))
         # 理由
-        cell_reason_general   = grp['理由_一般'].iloc[0] if '理由_一般' in grp.columns else ''
-        cell_reason_medicinal = grp['理由_薬用'].iloc[0] if '理由_薬用' in grp.columns else ''
+        cell_reason_general   = first_cell(rows, '理由_一般', '')
+        cell_reason_medicinal = first_cell(rows, '理由_薬用', '')
         reason_general   = '' if pd.isna(cell_reason_general) else cell_reason_general
         reason_medicinal = '' if pd.isna(cell_reason_medicinal) else cell_reason_medicinal
         # 改善提案
-        cell_proposal_general   = grp['改善提案_一般'].iloc[0] if '改善提案_一般' in grp.columns else ''
-        cell_proposal_medicinal = grp['改善提案_薬用'].iloc[0] if '改善提案_薬用' in grp.columns else ''
+        cell_proposal_general   = first_cell(rows, '改善提案_一般', '')
+        cell_proposal_medicinal = first_cell(rows, '改善提案_薬用', '')
         proposal_general   = '' if pd.isna(cell_proposal_general) else cell_proposal_general
         proposal_medicinal = '' if pd.isna(cell_proposal_medicinal) else cell_proposal_medicinal
         # 適正表現例
-        example_general   = parse_cell_list(grp['適正表現例_一般'].iloc[0]) if '適正表現例_一般' in grp.columns else []
-        example_medicinal = parse_cell_list(grp['適正表現例_薬用'].iloc[0]) if '適正表現例_薬用' in grp.columns else []
+        example_general   = parse_cell_list(first_cell(rows, '適正表現例_一般', None)) if '適正表現例_一般' in col_pos else []
+        example_medicinal = parse_cell_list(first_cell(rows, '適正表現例_薬用', None)) if '適正表現例_薬用' in col_pos else []
 
         ng_item = {
             'グループ':       group_name,
@@ -170,12 +246,12 @@ def build_ng_list(df_grp: pd.DataFrame, subcat_id: str) -> list:
 
 def main():
     # MergedMaster シート読み込み
-    df_master = pd.read_excel(EXCEL_FILE, sheet_name=SHEET_TABLE)
+    df_master = read_master_table(EXCEL_FILE, SHEET_TABLE)
 
     # サブカテゴリごとに JSON オブジェクトを生成
     subcats = []
     for subcat_id, df_grp in df_master.groupby('サブカテゴリID'):
-        subcat_name = df_grp['サブカテゴリ名'].iloc[0]
+        subcat_name = df_grp['サブカテゴリ名'].iat[0]
         text = parse_markdown(subcat_id, subcat_name)
         ng_list = build_ng_list(df_grp, subcat_id)
         subcats.append({
@@ -203,8 +279,11 @@ def main():
         'last_updated':      datetime.now(timezone(timedelta(hours=+9))).isoformat(),
         'global_categories': global_categories
     }
-    with open(OUTPUT_JSON, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    if orjson is not None:
+        Path(OUTPUT_JSON).write_bytes(orjson.dumps(output, option=orjson.OPT_INDENT_2))
+    else:
+        with open(OUTPUT_JSON, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
     print(f"→ {OUTPUT_JSON} を出力しました")
 
 
@@ -10,6 +10,8 @@ from data_processing import (
     convert_to_hiragana_preserving_katakana,
     convert_to_katakana,
     compile_ng_word,
+    _required_literal,
+    NGWordTable,
     extract_ng_data_by_subcategory,
     extract_ng_data_from_subcategories,
     get_ng_word_data,
@@ -77,11 +79,32 @@ def test_expand_placeholders(text, placeholders, expected_contains):
     (r"たった\d+日で", "たった100日で", True),     # 正常マッチ
     ("[", "[", True),     # 無効→フォールバック
     ("１日", "２日", False),     # 全角数字対応
+    (r"\d+日間", "x" + "1" * 5000, False),  # 長い数字列でも照合が線形で終わる
+    (r"\d+日間", "12３日間", True),         # 先頭の数字列は数字列の頭から一致
 ])
 def test_compile_ng_word_patterns(phrase, test_str, should_find):
     pat = compile_ng_word(phrase)
     assert bool(pat.search(test_str)) == should_find
 
+def test_compile_ng_word_finditer_after_digit_ending_match():
+    # 直前の一致が数字で終わっても、続く数字列の途中から次の一致を見つける
+    spans = [m.span() for m in compile_ng_word(r"\d+x1").finditer("1x12x1")]
+    assert spans == [(0, 3), (3, 6)]
+
+@pytest.mark.parametrize("phrase,expected", [
+    ("肌(の)?疲れ", "肌"),          # グループ直前までが必須
+    (r"たった\d+日で", "たった"),   # メタ文字で打ち切り
+    ("肌の?疲れ", "肌"),            # ? 直前の文字は省略され得る
+    ("ヒアルロン酸", "ひあるろん酸"),  # カタカナはひらがなに正規化
+    ("A|B", ""),                    # トップレベルの | は絞り込み不可
+    ("(を)?改善", ""),               # 先頭がグループ
+    (r"肌\)|疲れ", ""),              # エスケープした括弧はグループではない
+    ("肌[(]|疲れ", ""),              # 文字クラス内の括弧もグループではない
+    ("肌[|]疲れ", "肌"),             # 文字クラス内の | は選択ではない
+])
+def test_required_literal(phrase, expected):
+    assert _required_literal(phrase) == expected
+
 # --- 6. NGワードデータ抽出 ---
 def test_extract_ng_data_by_subcategory_default_branch():
     data = {"global_categories": [
@@ -113,6 +136,16 @@ def test_extract_ng_data_from_subcategories_fallback(sample_subcategory):
     assert detail["適正表現例"] == ["OK"]
 
 
+def test_ng_word_table_sorted_entries(sample_subcategory):
+    ng = extract_ng_data_from_subcategories(sample_subcategory, selected_usage="A", selected_product="P")
+    assert isinstance(ng, NGWordTable)
+    table = NGWordTable({"肌": {"original": "肌"}, "肌疲れ": {"original": "肌疲れ"}})
+    # 長いワードから順に並び、pattern / literal は構築時に補われる
+    assert [d["original"] for _, _, d in table.sorted_entries] == ["肌疲れ", "肌"]
+    assert table.sorted_entries[0][0] == "肌疲れ"
+    assert table.sorted_entries[0][1].search("肌疲れ")
+
+
 # --- 7. get_ng_word_data ---
 def test_get_ng_word_data(tmp_path, sample_ng_json):
     p = tmp_path / 'ng.json'
@@ -120,6 +153,17 @@ def test_get_ng_word_data(tmp_path, sample_ng_json):
     ng_map = get_ng_word_data(str(p))
     assert isinstance(ng_map, dict)
 
+def test_get_ng_word_data_cached_until_file_changes(tmp_path, sample_ng_json):
+    import os
+    p = tmp_path / 'ng.json'
+    p.write_text(json.dumps(sample_ng_json), encoding='utf-8')
+    first = get_ng_word_data(str(p))
+    assert get_ng_word_data(str(p)) is first
+    # 更新時刻が変わればキャッシュを使わずに読み直す
+    st = os.stat(p)
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert get_ng_word_data(str(p)) is not first
+
 # --- 8. mask_safe_expressions ---
 def test_mask_safe_expressions_invalid_and_dedup():
     text = "foo[bar] foo[bar]"
@@ -127,6 +171,15 @@ def test_mask_safe_expressions_invalid_and_dedup():
     masked = mask_safe_expressions(text, ng_map)
     assert masked == "foo[□□□] foo[□□□]"
 
+@pytest.mark.parametrize("exclusions,text,expected", [
+    (["防ぐ", "疲れを防ぐ"], "疲れを防ぐ", "疲れを□□"),   # 先に登録された除外表現から順にマスク
+    (["CDE", "ABCD"], "abcde", "ab□□□"),
+])
+def test_mask_safe_expressions_applies_in_order(exclusions, text, expected):
+    ng_map = {"X": {"original": "X", "category": "c", "除外表現": exclusions}}
+    assert mask_safe_expressions(text, ng_map) == expected
+    assert mask_safe_expressions(text, NGWordTable(ng_map)) == expected
+
 # --- 9. check_advertisement_with_categories_masking / highlight ---
 def test_check_and_highlight_flow(ng_word_map):
     text = "化粧水で肌疲れケア"
@@ -135,6 +188,21 @@ def test_check_and_highlight_flow(ng_word_map):
     html = highlight_prohibited_phrases(text, violations)
     assert '<span' in html and '肌疲れ' in html
 
+def test_check_skips_zero_length_matches():
+    # 長さ 0 の一致は採用せず、文末でも落ちない。同じ位置の通常の一致は妨げない
+    table = NGWordTable({
+        "x?": {"original": "x?", "category": "c"},
+        "肌": {"original": "肌", "category": "c"},
+    })
+    violations = check_advertisement_with_categories_masking("あ肌い", table)
+    assert [(v["表現"], v["開始位置"], v["終了位置"]) for v in violations] == [("肌", 1, 2)]
+
+def test_highlight_escapes_ad_text():
+    text = "<b>肌疲れ</b>"
+    html = highlight_prohibited_phrases(text, [{"開始位置": 3, "終了位置": 6}])
+    assert "<b>" not in html and "&lt;b&gt;" in html
+    assert ">肌疲れ</span>" in html
+
 # --- 10. check_ingredient_context ---
 @pytest.mark.parametrize("text,ing,eff,excl,expected_count", [
     ("ヒアルロン酸使用", '{SEIBUN}', '{MOKUTEKI}', None, 1),
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from json_export_script import build_ng_list
+
+# --- build_ng_list ---
+def test_build_ng_list_without_example_columns():
+    # 適正表現例_一般 / 適正表現例_薬用 列がないシートでも落ちずに空リストになる
+    df = pd.DataFrame({
+        'サブカテゴリID': ['S1', 'S1'],
+        'サブカテゴリ名': ['テスト', 'テスト'],
+        'グループID':     ['G1', 'G1'],
+        'グループ名':     ['グループ1', 'グループ1'],
+        '用途_スキンケア': ['〇', ''],
+        '製品_化粧水':     ['', '〇'],
+        '対象ワード':     ['肌疲れ', 'くすみ'],
+        '理由_一般':      ['理由', None],
+    })
+    ng_list = build_ng_list(df, 'S1')
+    assert len(ng_list) == 1
+    item = ng_list[0]
+    assert item['適正表現例'] == {'一般': [], '薬用': []}
+    assert item['用途区分'] == ['スキンケア'] and item['製品名'] == []
+    assert item['対象ワード'] == ['肌疲れ', 'くすみ']
+    assert item['理由'] == {'一般': '理由', '薬用': ''}
@@ -3,6 +3,8 @@ import sys
 # tests/ のひとつ上のフォルダ（プロジェクトルート）を検索パスに追加
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import random
+
 import pytest
 import requests
 from unittest.mock import Mock
@@ -20,26 +22,26 @@ from ui import (
 # --- submit_ad_text のテスト ---
 def test_submit_ad_text_success(monkeypatch):
     called = {}
-    def fake_post(url, data, headers):
+    def fake_post(url, data, headers, timeout):
         called['url'] = url
         called['data'] = data
         called['headers'] = headers
         return Mock(status_code=200)
-    monkeypatch.setattr(requests, 'post', fake_post)
+    monkeypatch.setattr(ui, '_get_form_session', lambda: Mock(post=fake_post))
 
-    # 呼び出し時に例外が発生しないことを確認
-    submit_ad_text('テスト広告文')
+    # 呼び出し時に例外が発生しないことを確認（送信はバックグラウンドなので完了を待つ）
+    submit_ad_text('テスト広告文').result()
     assert called['url'] == ui.AD_FORM_URL
     assert called['data'] == {ui.AD_ENTRY_ID: 'テスト広告文'}
 
 # Exception 発生時にも例外を投げない
 
 def test_submit_ad_text_exception(monkeypatch):
-    def fake_post(url, data, headers):
+    def fake_post(url, data, headers, timeout):
         raise requests.exceptions.ConnectionError
-    monkeypatch.setattr(requests, 'post', fake_post)
+    monkeypatch.setattr(ui, '_get_form_session', lambda: Mock(post=fake_post))
     # 例外が内包され、何も起きない
-    submit_ad_text('広告文')  # should not raise
+    submit_ad_text('広告文').result()  # should not raise
 
 # --- merge_violations のテスト ---
 def test_merge_violations_combines_overlaps():
@@ -115,7 +117,7 @@ def test_submit_feedback_status_codes(monkeypatch, status, expected_msg):
     st.session_state.feedback_area = "ありがと"
     # requests.post をモックしてステータスを返す
     fake_resp = Mock(status_code=status)
-    monkeypatch.setattr(requests, "post", lambda url, data: fake_resp)
+    monkeypatch.setattr(ui, "_get_form_session", lambda: Mock(post=lambda url, data, timeout: fake_resp))
 
     ui.submit_feedback()
     assert st.session_state.feedback_message == expected_msg
@@ -129,9 +131,9 @@ def test_submit_feedback_status_codes(monkeypatch, status, expected_msg):
 def test_submit_feedback_exception(monkeypatch):
     st.session_state.feedback_area = "問題報告"
     # post が例外を投げる
-    def raise_error(url, data):
+    def raise_error(url, data, timeout):
         raise requests.exceptions.ConnectionError
-    monkeypatch.setattr(requests, "post", raise_error)
+    monkeypatch.setattr(ui, "_get_form_session", lambda: Mock(post=raise_error))
 
     ui.submit_feedback()
     assert st.session_state.feedback_message == "送信中にエラーが発生しました。"
@@ -140,6 +142,17 @@ def test_submit_feedback_exception(monkeypatch):
 def reset_session_and_mocks(request, monkeypatch):
     # セッションステートクリア
     st.session_state.clear()
+    # プロセス内で共有している NGワード・サブカテゴリのキャッシュを捨てる
+    ui.clear_ng_words_cache()
+    # st.sidebar を差し替えるテストでは Streamlit のキャッシュ機構が動かないため、サブカテゴリは毎回読み込む
+    def load_subcategories(version):
+        return ui.extract_ng_data_by_subcategory(ui.load_json(ui.NG_JSON_PATH))
+    load_subcategories.clear = lambda: None
+    monkeypatch.setattr(ui, '_load_subcategories', load_subcategories)
+    def load_product_index(version):
+        return ui._build_product_index(ui._load_subcategories(version))
+    load_product_index.clear = lambda: None
+    monkeypatch.setattr(ui, '_load_product_index', load_product_index)
     # render_sidebar は "test_render_sidebar_" 系のテストでは本物を呼ぶ
     if not request.node.name.startswith("test_render_sidebar_"):
         monkeypatch.setattr(ui, 'render_sidebar', lambda: ("一般化粧品", "スキンケア", "化粧水"))
@@ -227,6 +240,33 @@ def test_render_main_with_violations(monkeypatch):
     assert any(c[0]=='markdown' and "例1" in c[1] for c in calls)
     assert any(c[0]=='markdown' and "法令A" in c[1] for c in calls)
 
+def test_render_main_escapes_violation_message(monkeypatch):
+    calls = stub_st_methods(monkeypatch, text_area_return="広告文", button_return=True)
+    fake_vio = {"表現": "NG", "開始位置": 0, "終了位置": 2, "カテゴリ": "test",
+                "指摘事項": "<img src=x onerror=alert(1)>理由"}
+    monkeypatch.setattr(ui, 'check_advertisement_with_categories_masking', lambda text, d: [fake_vio])
+    ui.render_main()
+    # 指摘事項は HTML として解釈されないようエスケープされる
+    details = [c[1] for c in calls if c[0] == 'markdown' and "理由" in c[1]]
+    assert details and "<img" not in details[0] and "&lt;img src=x onerror=alert(1)&gt;理由" in details[0]
+
+def test_run_check_reuses_previous_result(monkeypatch):
+    calls = []
+    def fake_check(text, d):
+        calls.append(text)
+        return [{"表現": "NG", "開始位置": 0, "終了位置": 2}]
+    monkeypatch.setattr(ui, 'check_advertisement_with_categories_masking', fake_check)
+    ng_dict = {}
+    first = ui.run_check("広告文", ng_dict)
+    first[0]["count"] = 1
+    # 同じ広告文・同じ辞書なら再チェックせず、前回の結果は書き換えられていない
+    assert ui.run_check("広告文", ng_dict) == [{"表現": "NG", "開始位置": 0, "終了位置": 2}]
+    assert calls == ["広告文"]
+    # 広告文または辞書が変われば再チェック
+    ui.run_check("別の広告文", ng_dict)
+    ui.run_check("別の広告文", {})
+    assert calls == ["広告文", "別の広告文", "別の広告文"]
+
 # --- USE_USAGE_FILTER = False 時の render_sidebar ---
 def test_render_sidebar_usage_filter_off(monkeypatch):
     # ■ 用途フィルターOFF時の動作検証
@@ -258,6 +298,36 @@ def test_merge_violations_contains_and_boundary():
     starts = sorted(v['開始位置'] for v in merged)
     assert starts == [0, 12]
 
+def _merge_violations_nested(violations, tolerance=2):
+    # 索引を使う前の総当たり実装（比較用）
+    merged = []
+    for v in violations:
+        if not any(
+            (v["開始位置"] >= m["開始位置"] and v["終了位置"] <= m["終了位置"]) or
+            (abs(v["開始位置"] - m["開始位置"]) < tolerance and abs(v["終了位置"] - m["終了位置"]) < tolerance)
+            for m in merged
+        ):
+            merged.append(v)
+    return merged
+
+@pytest.mark.parametrize("tolerance", [-1, 0, 1, 2, 3])
+def test_merge_violations_matches_nested_loop(tolerance):
+    rng = random.Random(tolerance)
+    # 同一範囲・接する範囲を含む固定ケース
+    cases = [[{'開始位置': 3, '終了位置': 5}, {'開始位置': 3, '終了位置': 5}, {'開始位置': 5, '終了位置': 7},
+              {'開始位置': 1, '終了位置': 3}, {'開始位置': 4, '終了位置': 4}]]
+    # 狭い範囲に集めて、重なり・近接・同一位置が頻繁に起きるようにする
+    for _ in range(500):
+        vios = []
+        for _ in range(rng.randint(0, 30)):
+            start = rng.randint(0, 20)
+            vios.append({'開始位置': start, '終了位置': start + rng.randint(0, 6)})
+        cases.append(vios)
+    for vios in cases:
+        expected = _merge_violations_nested(vios, tolerance)
+        result = ui.merge_violations(vios, tolerance=tolerance)
+        assert [id(v) for v in result] == [id(v) for v in expected]
+
 # --- merge_same_ng_violations の ingredient 優先テスト ---
 def test_merge_same_ng_violations_ingredient_priority():
     violations = [
@@ -280,6 +350,28 @@ def test_get_ng_words_idempotent():
     # 必須キーは揃っていること
     assert set(r1.keys()) == {'ng_dict', 'subcategories'}
 
+def test_get_ng_words_shared_until_json_changes(monkeypatch):
+    # 同じ組み合わせは構築済みの結果を共有し、NGword.json が更新されたら作り直す
+    calls = []
+    monkeypatch.setattr(ui, 'extract_ng_data_by_subcategory', lambda data: {'共通': [], '一般化粧品': []})
+    monkeypatch.setattr(ui, 'extract_ng_data_from_subcategories', lambda subs, u, p, c: calls.append(p) or {'n': len(calls)})
+    monkeypatch.setattr(ui, '_ng_json_version', lambda: 1)
+    r1 = ui.get_ng_words('一般化粧品', 'ボディケア', '共有テスト')
+    assert ui.get_ng_words('一般化粧品', 'ボディケア', '共有テスト') is r1
+    monkeypatch.setattr(ui, '_ng_json_version', lambda: 2)
+    r2 = ui.get_ng_words('一般化粧品', 'ボディケア', '共有テスト')
+    assert r2 is not r1 and len(calls) == 2
+    # 古い版の結果は保持し続けない
+    _, store = ui._get_ng_words_store()
+    assert all(key[3] == 2 for key in store)
+
+def test_clear_ng_words_cache(monkeypatch):
+    monkeypatch.setattr(ui, 'extract_ng_data_by_subcategory', lambda data: {'共通': [], '一般化粧品': []})
+    monkeypatch.setattr(ui, 'extract_ng_data_from_subcategories', lambda subs, u, p, c: {})
+    r1 = ui.get_ng_words('一般化粧品', 'ネイルケア', 'クリアテスト')
+    ui.clear_ng_words_cache()
+    assert ui.get_ng_words('一般化粧品', 'ネイルケア', 'クリアテスト') is not r1
+
 def test_get_ng_words_medicated_branch(monkeypatch):
     # 医薬部外品（薬用化粧品）ブランチのテスト
     fake_data = {}
@@ -304,12 +396,8 @@ def test_render_sidebar_update_flow(monkeypatch):
     monkeypatch.setattr(st.sidebar, 'button', lambda label, **kwargs: True)
     # キャッシュクリア／rerun の呼ばれたことを記録するフラグ
     flags = {"cleared": False, "rerun": False}
-    # st.cache_data を DummyCache に差し替え
-    class DummyCache:
-        @staticmethod
-        def clear():
-            flags["cleared"] = True
-    monkeypatch.setattr(st, 'cache_data', DummyCache)
+    # NGワードのキャッシュだけがクリアされることを確認する
+    monkeypatch.setattr(ui, 'clear_ng_words_cache', lambda: flags.__setitem__("cleared", True))
     # experimental_rerun は存在しない属性なので raising=False で用意
     monkeypatch.setattr(st, 'experimental_rerun',
                         lambda: (_ for _ in ()).throw(AttributeError()),
@@ -3,19 +3,29 @@
 #  UI（ユーザーインターフェース）処理プロンプト
 ##################################
 
+import bisect
+import html
+import threading
 import streamlit as st
-import requests
-import pandas as pd
-from typing import Any, List, Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, List, Dict, Optional, Tuple
 from data_processing import ViolationItem
-import time 
 import os
 
+# requests はフォーム送信時にだけ使うので、起動時には読み込まない（_get_form_session 内で import）
+if TYPE_CHECKING:
+    import requests
+
 # ===== 用途区分フィルタの on/off =====
 # Comment out the next line to disable usage-based filtering
 USE_USAGE_FILTER = True  # True -> ON, False -> OFF
 # ================================
 
+# NGワード定義ファイル
+NG_JSON_PATH = "NGword.json"
+# 大区分の表示名 → NGword.json 上のサブカテゴリ区分
+CATEGORY_OPTION_MAP = {"一般化粧品": "一般化粧品", "医薬部外品（薬用化粧品）": "薬用化粧品"}
+
 # 以下、データ処理モジュールから主要な関数をインポート
 from data_processing import (
     load_json,
@@ -26,32 +36,63 @@ from data_processing import (
     highlight_prohibited_phrases,
     normalize_text,
 )
-import pandas as pd
 
 # ─────────────────────────────────────────────────
 # ★ Googleフォーム連携設定
 # ユーザーがチェックした広告文をバックグラウンドで記録する
 AD_FORM_URL = "https://docs.google.com/forms/d/e/1FAIpQLSc_Y8CjcT5LP-K_nCXZmcFuP9qOm3AJkcWNilJlDjBHbHXmYA/formResponse"
 AD_ENTRY_ID = "entry.981221194"
+# フォーム送信のタイムアウト（接続, 読み込み）秒
+FORM_TIMEOUT = (2, 5)
 
-def submit_ad_text(ad_text: str):
+@st.cache_resource(show_spinner=False)
+def _get_form_session() -> "requests.Session":
     """
-   広告文を Google フォームに送信し、利用状況を記録。
-   失敗しても処理を中断しない（ログ不要と判断）。
+    Google フォーム送信用の Session を返す。
+    Streamlit の再実行をまたいで使い回し、送信ごとの TCP/TLS 接続確立を省く。
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
 
-    Args:
-        ad_text (str): ユーザー入力の広告文
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+    return session
+
+@st.cache_resource(show_spinner=False)
+def _get_form_executor() -> ThreadPoolExecutor:
     """
+    広告文の記録をバックグラウンドで送るためのスレッドプールを返す。
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="ad-form")
+
+def _post_ad_text(ad_text: str) -> None:
     try:
         # フォームにPOSTリクエスト送信
-        requests.post(
+        _get_form_session().post(
             AD_FORM_URL,
             data={AD_ENTRY_ID: ad_text},
-            headers={"User-Agent": "Mozilla/5.0", "Referer": AD_FORM_URL}
+            headers={"User-Agent": "Mozilla/5.0", "Referer": AD_FORM_URL},
+            timeout=FORM_TIMEOUT,
         )
     except Exception:
         # ネットワークエラー等は無視
         pass
+
+def submit_ad_text(ad_text: str) -> Optional[Future]:
+    """
+   広告文を Google フォームに送信し、利用状況を記録。
+   送信はバックグラウンドで行い、チェック結果の表示を待たせない。
+   失敗しても処理を中断しない（ログ不要と判断）。
+
+    Args:
+        ad_text (str): ユーザー入力の広告文
+    Returns:
+        Optional[Future]: 送信タスク（投入できなかった場合は None）
+    """
+    try:
+        return _get_form_executor().submit(_post_ad_text, ad_text)
+    except Exception:
+        return None
 # ─────────────────────────────────────────────────
 
 # ---------------------------
@@ -71,17 +112,36 @@ def merge_violations(
     Returns:
         List[ViolationItem]: 重複除去後の違反リスト
     """
+    # 採用済みの違反と総当たりで比べず、開始位置で索引して判定する（採用結果・順序は入力順の総当たりと同じ）
+    #   完全包含: 開始位置が v 以下の採用済みのうち最大の終了位置を Fenwick 木（開始位置を座標圧縮）で引く
+    #   近接:     開始位置が v の ±tolerance 未満の採用済みだけを、(開始, 終了) の昇順リストから二分探索で取り出す
+    starts = sorted({v["開始位置"] for v in violations})
+    rank = {start: i for i, start in enumerate(starts, start=1)}
+    max_end = [float("-inf")] * (len(starts) + 1)
+    kept_spans: List[Tuple[int, int]] = []
     merged: List[ViolationItem] = []
     for v in violations:
-        dup = False
-        for m in merged:
-            # 完全包含またはほぼ同一位置とみなしたら重複扱い
-            if (v["開始位置"] >= m["開始位置"] and v["終了位置"] <= m["終了位置"]) or \
-               (abs(v["開始位置"] - m["開始位置"]) < tolerance and abs(v["終了位置"] - m["終了位置"]) < tolerance):
-                dup = True
-                break
-        if not dup:
-            merged.append(v)
+        start, end = v["開始位置"], v["終了位置"]
+        # 完全包含の判定
+        contained_end = float("-inf")
+        i = rank[start]
+        while i > 0:
+            contained_end = max(contained_end, max_end[i])
+            i -= i & -i
+        if contained_end >= end:
+            continue
+        # ほぼ同一位置の判定
+        if tolerance > 0:
+            lo = bisect.bisect_right(kept_spans, (start - tolerance, float("inf")))
+            hi = bisect.bisect_left(kept_spans, (start + tolerance, float("-inf")))
+            if any(abs(end - kept_end) < tolerance for _, kept_end in kept_spans[lo:hi]):
+                continue
+        merged.append(v)
+        bisect.insort(kept_spans, (start, end))
+        i = rank[start]
+        while i <= len(starts):
+            max_end[i] = max(max_end[i], end)
+            i += i & -i
     return merged
 
 
@@ -97,13 +157,21 @@ def merge_same_ng_violations(
         List[ViolationItem]: 重複マージ後、各ワードごと1レコードに集約
     """
     merged: Dict[str, ViolationItem] = {}
+    # 同じワードが繰り返し現れるので、正規化結果はこの呼び出しの中で使い回す
+    normalized_keys: Dict[str, str] = {}
     for v in violations:
         # ingredient フィールド優先、なければ 表現 フィールドをキーに
         raw_key = v.get("ingredient") or v.get("表現")
-        key = normalize_text(raw_key) if raw_key else ""
-        if key in merged:
-            # 既存レコードにカウントを加算
-            merged[key]["count"] = merged[key].get("count", 1) + 1
+        if not raw_key:
+            key = ""
+        elif raw_key in normalized_keys:
+            key = normalized_keys[raw_key]
+        else:
+            key = normalized_keys[raw_key] = normalize_text(raw_key)
+        entry = merged.get(key)
+        if entry is not None:
+            # 既存レコードにカウントを加算（登録時に count を入れているので必ずある）
+            entry["count"] += 1
         else:
             # 新規登録時に初期カウントを1に設定
             v["count"] = 1
@@ -111,24 +179,82 @@ def merge_same_ng_violations(
     return list(merged.values())
 # ---------------------------
 
-@st.cache_data(show_spinner=False)
+@st.cache_resource(show_spinner=False)
+def _get_ng_words_store() -> Tuple[threading.Lock, Dict[tuple, Dict[str, Any]]]:
+    """
+    get_ng_words の結果を (大区分, 用途, 製品, NGword.json の更新時刻) ごとに保持する辞書とそのロック。
+    保持するのは現在の NGword.json の結果だけ（更新時刻が変われば古いものは get_ng_words が捨てる）。
+    Streamlit は ui.py を再実行するたびにモジュール変数を作り直すため、cache_resource で保持する。
+    st.cache_data と違い、ヒット時に結果をコピー（pickle 往復）しない。
+    """
+    return threading.Lock(), {}
+
+
+def _ng_json_version() -> Optional[int]:
+    # NGword.json の更新時刻（ファイルがなければ None）
+    try:
+        return os.stat(NG_JSON_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_subcategories(version: Optional[int]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    NGword.json を読み込み、グローバルカテゴリ"化粧品等"からサブカテゴリを抽出して返す。
+    サイドバーと get_ng_words で共有し、NGword.json が更新される（version が変わる）まで読み直さない。
+
+    Args:
+        version (Optional[int]): NGword.json の更新時刻（キャッシュのキー）
+    """
+    return extract_ng_data_by_subcategory(load_json(NG_JSON_PATH))
+
+
 def get_ng_words(
     selected_category: str,
     selected_usage: str,
     selected_product: str
 ) -> Dict[str, Any]:
+    """
+    選択された大区分・用途・製品に対応する NGワード辞書とサブカテゴリ一覧を返す。
+    同じ組み合わせ・同じ NGword.json に対しては、プロセス内で一度だけ構築した結果を共有する。
+    """
+    version = _ng_json_version()
+    key = (selected_category, selected_usage, selected_product, version)
+    lock, store = _get_ng_words_store()
+    with lock:
+        if key not in store:
+            # NGword.json が更新されていたら、古い版の結果は二度と使われないので捨てる
+            for stale in [k for k in store if k[3] != version]:
+                del store[stale]
+            store[key] = _build_ng_words(selected_category, selected_usage, selected_product, version)
+        return store[key]
+
+
+def clear_ng_words_cache() -> None:
+    """
+    get_ng_words が保持している結果と、読み込み済みのサブカテゴリ・製品名索引をすべて破棄する。
+    """
+    lock, store = _get_ng_words_store()
+    with lock:
+        store.clear()
+    _load_subcategories.clear()
+    _load_product_index.clear()
+
+
+def _build_ng_words(
+    selected_category: str,
+    selected_usage: str,
+    selected_product: str,
+    version: Optional[int],
+) -> Dict[str, Any]:
     
     # 「一般」 or 「薬用」を区別
     category_type = "一般" if selected_category == "一般化粧品" else "薬用"
 
-    option_map = {
-        "一般化粧品": "一般化粧品",
-        "医薬部外品（薬用化粧品）": "薬用化粧品"
-    }
-    # JSONファイルのロード
-    data = load_json("NGword.json")
-    # グローバルカテゴリ"化粧品等"からサブカテゴリを抽出
-    subcats = extract_ng_data_by_subcategory(data)
+    option_map = CATEGORY_OPTION_MAP
+    # グローバルカテゴリ"化粧品等"のサブカテゴリ（読み込み済みのものを共有）
+    subcats = _load_subcategories(version)
        
     ng_dict = extract_ng_data_from_subcategories({
         "共通": subcats["共通"],
@@ -141,6 +267,50 @@ def get_ng_words(
     }
 
 
+def _build_product_index(
+    subcats: Dict[str, List[Dict[str, Any]]],
+) -> Dict[Tuple[str, Optional[str]], List[str]]:
+    """
+    (大区分, 用途) → ソート済み製品名一覧 の索引を作る。
+    用途で絞り込まない場合の一覧は (大区分, None) に入れる。
+    """
+    index: Dict[Tuple[str, Optional[str]], List[str]] = {}
+    for category, option in CATEGORY_OPTION_MAP.items():
+        all_products = set()
+        products_by_usage: Dict[str, set] = {}
+        for sub in subcats["共通"] + subcats[option]:
+            for group in sub.get("NGワードと禁止理由", []):
+                products = group.get("製品名", [])
+                all_products.update(products)
+                for usage in group.get("用途区分", []):
+                    products_by_usage.setdefault(usage, set()).update(products)
+        index[(category, None)] = sorted(all_products)
+        for usage, products in products_by_usage.items():
+            index[(category, usage)] = sorted(products)
+    return index
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_product_index(version: Optional[int]) -> Dict[Tuple[str, Optional[str]], List[str]]:
+    """
+    NGword.json のバージョンごとに製品名の索引を一度だけ作る（再実行のたびにサブカテゴリを走査しない）。
+    """
+    return _build_product_index(_load_subcategories(version))
+
+
+def _product_options(
+    index: Dict[Tuple[str, Optional[str]], List[str]],
+    selected_category: str,
+    selected_usage: str,
+) -> List[str]:
+    """
+    選択された大区分・用途に該当するグループの製品名一覧（ソート済み）を返す。
+    """
+    # 用途フィルタONなら、その用途のグループだけに絞る
+    usage_key = selected_usage if USE_USAGE_FILTER else None
+    return index.get((selected_category, usage_key), [])
+
+
 # ---------------------------
 # サイドバー処理：大区分・用途区分・フィードバックなどを集約
 # ---------------------------
@@ -166,11 +336,8 @@ def render_sidebar():
 # ===== 開発用：手動更新ボタン =====
 # ※開発中だけ有効化したい場合は、次のコメントを外してください
     if st.sidebar.button("🔄 更新"):
-        # キャッシュをクリアして JSON などを再読み込みさせる
-        try:
-            st.cache_data.clear()
-        except AttributeError:
-            pass
+        # NGワードのキャッシュだけを捨てて JSON を再読み込みさせる（他のキャッシュは温存）
+        clear_ng_words_cache()
         # 更新完了時刻を記録
         import datetime
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -203,28 +370,8 @@ def render_sidebar():
         # フィルタOFF時は空文字を返す
         selected_usage = ""
 
-    # ③ JSON からサブカテゴリを取得して絞り込み
-    data    = load_json("NGword.json")
-    subcats = extract_ng_data_by_subcategory(data)
-    option_map = {"一般化粧品": "一般化粧品", "医薬部外品（薬用化粧品）": "薬用化粧品"}
-    raw_list = subcats["共通"] + subcats[option_map[selected_category]]
-
-#    # ★ デバッグ: フィルタ後のサブカテゴリ名を確認
-#    st.sidebar.write("🎯 フィルタ後サブカテゴリ:", [sub.get("name") for sub in filtered])
-
-    # ④ フィルタ後の JSON 定義から製品名一覧を収集
-    product_set = set()
-    for sub in raw_list:
-#        # ★ デバッグ: 各サブカテゴリの中身を確認
-#        st.sidebar.write(f"— サブカテゴリ {sub.get('name')}")
-
-        for group in sub.get("NGワードと禁止理由", []):
-            # 用途フィルタONなら、ここで弾く
-            if USE_USAGE_FILTER and selected_usage not in group.get("用途区分", []):
-                continue
-            for p in group.get("製品名", []):
-                product_set.add(p)
-    product_list = sorted(product_set)
+    # ③④ JSON のサブカテゴリ（get_ng_words と共有）から製品名一覧を収集
+    product_list = _product_options(_load_product_index(_ng_json_version()), selected_category, selected_usage)
 
 #    st.sidebar.write("🔍 JSONを読み込んでいるパス:", os.path.abspath("NGword.json"))
 #    st.sidebar.write("🔍 製品候補:", product_list)
@@ -261,7 +408,11 @@ def submit_feedback():
         FEEDBACK_FORM_URL = "https://docs.google.com/forms/..."
         FEEDBACK_ENTRY_ID = "entry.745635231"
         try:
-            resp = requests.post(FEEDBACK_FORM_URL, data={FEEDBACK_ENTRY_ID: st.session_state.feedback_area})
+            resp = _get_form_session().post(
+                FEEDBACK_FORM_URL,
+                data={FEEDBACK_ENTRY_ID: st.session_state.feedback_area},
+                timeout=FORM_TIMEOUT,
+            )
             if resp.status_code in (200,302):
                 st.session_state.feedback_message = "フィードバックありがとうございました！"
                 st.session_state.feedback_area = ""
@@ -272,6 +423,25 @@ def submit_feedback():
     else:
         st.session_state.feedback_message = "入力してから送信してください。"
 
+def run_check(ad_text: str, ng_dict: Dict[str, Any]) -> List[ViolationItem]:
+    """
+    広告文の NG チェックを実行する。
+    直前のチェックと広告文・NGワード辞書（get_ng_words が共有する同一オブジェクト）が
+    同じなら、前回の結果を session_state から再利用する。
+
+    Returns:
+        List[ViolationItem]: 検出結果（呼び出し側で書き換えてよいよう、毎回コピーを返す）
+    """
+    last = st.session_state.get("last_check")
+    if last is not None and last[0] == ad_text and last[1] is ng_dict:
+        violations = last[2]
+    else:
+        violations = check_advertisement_with_categories_masking(ad_text, ng_dict) or []
+        st.session_state.last_check = (ad_text, ng_dict, violations)
+    # merge_same_ng_violations が count を書き込むので、キャッシュ側の辞書は渡さない
+    return [dict(v) for v in violations]
+
+
 # ---------------------------
 # メイン画面の処理
 # ---------------------------
@@ -284,7 +454,7 @@ def render_main():
     # サイドバーからカテゴリ・用途・製品名を取得
     selected_category, selected_usage, selected_product = render_sidebar()
 
-    data = load_json("NGword.json")# 🔧 get_ng_words によるフィルタ付き NGワード取得
+    # 🔧 get_ng_words によるフィルタ付き NGワード取得（JSON はサイドバーと共有のキャッシュから）
     ng_data = get_ng_words(selected_category, selected_usage, selected_product)
     ng_dict = ng_data["ng_dict"]
 
@@ -316,8 +486,8 @@ def render_main():
         # フォームに記録
         submit_ad_text(ad_text)
 
-        # NGチェック実行
-        violations = check_advertisement_with_categories_masking(ad_text, ng_dict) or []
+        # NGチェック実行（広告文・NGワード辞書が前回と同じなら結果を再利用）
+        violations = run_check(ad_text, ng_dict)
 
 
 
@@ -340,21 +510,25 @@ def render_main():
             st.warning(f"⚠️ 気になる表現が {len(all_violations)} 件見つかりました！")
             st.write(highlight_prohibited_phrases(ad_text, all_violations), unsafe_allow_html=True)
             st.subheader("👩‍🏫 改善提案・適正表現例と関連情報")
+            # 違反ごとの説明はまとめて組み立て、1 回の st.markdown で描画する（要素数を違反数に比例させない）
+            blocks: List[str] = []
             for v in all_violations:
                 label = v.get("ingredient") or v.get("表現")
-                st.markdown(f"**<span style='color:red'>{label}</span>**", unsafe_allow_html=True)
-                st.write(v.get("指摘事項") or v.get("message"))
+                blocks.append(f"**<span style='color:red'>{label}</span>**")
+                # 指摘事項は以前 st.write で表示していた（HTML は解釈しない）ので、エスケープして埋め込む
+                blocks.append(html.escape(str(v.get("指摘事項") or v.get("message")), quote=False))
                 impr = v.get("改善提案") or []
                 if isinstance(impr, str): impr = [impr]
                 if impr:
-                    st.markdown(f"<span style='color:#FF8C00;font-weight:bold'>💡 改善提案:</span> {'、'.join(impr)}", unsafe_allow_html=True)
+                    blocks.append(f"<span style='color:#FF8C00;font-weight:bold'>💡 改善提案:</span> {'、'.join(impr)}")
                 ex = v.get("適正表現例") or []
                 if ex:
-                    st.markdown(f"<span style='color:#FF8C00;font-weight:bold'>🔧 適正表現例:</span> {'、'.join(ex)}", unsafe_allow_html=True)
+                    blocks.append(f"<span style='color:#FF8C00;font-weight:bold'>🔧 適正表現例:</span> {'、'.join(ex)}")
                 laws = v.get("関連法令等") or []
                 if laws:
-                    st.markdown(f"<span style='color:#FF8C00;font-weight:bold'>📄 関連法令等:</span> {'、'.join(laws)}", unsafe_allow_html=True)
-                st.markdown("---")
+                    blocks.append(f"<span style='color:#FF8C00;font-weight:bold'>📄 関連法令等:</span> {'、'.join(laws)}")
+                blocks.append("---")
+            st.markdown("\n\n".join(blocks), unsafe_allow_html=True)
         else:
             st.success("✅ 問題のある表現は見つかりませんでした。")
 